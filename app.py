@@ -1,24 +1,83 @@
 # app.py
 # Usage:
 # 1) (optional) create venv and activate
-# 2) pip install fastapi uvicorn requests python-multipart
+# 2) pip install fastapi uvicorn httpx orjson python-multipart
 # 3) pip install playwright
 # 4) python -m playwright install chromium
 # 5) uvicorn app:app --reload --host 127.0.0.1 --port 8080
+#    (uvicorn picks uvloop automatically when installed; it is not available on Windows)
 
 import asyncio
 import time
 import os
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from functools import partial
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Dict, Mapping, Optional, Tuple
 
-import requests
+import httpx
+import orjson
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-app = FastAPI()
+http_client: Optional[httpx.AsyncClient] = None  # shared client, created in lifespan
+
+_SCRIPT_JS_PATH = os.path.join(os.path.dirname(__file__), "script.js")
+_SCRIPT_JS_CACHE: Optional[str] = None
+_SCRIPT_JS_MTIME: Optional[float] = None
+
+
+def _get_local_script() -> Optional[str]:
+    """
+    Return the contents of ./script.js from memory, re-reading only when its mtime changes.
+    Returns None if the file does not exist.
+    """
+    global _SCRIPT_JS_CACHE, _SCRIPT_JS_MTIME
+    try:
+        mtime = os.stat(_SCRIPT_JS_PATH).st_mtime
+    except OSError:
+        _SCRIPT_JS_CACHE = _SCRIPT_JS_MTIME = None
+        return None
+    if _SCRIPT_JS_CACHE is None or mtime != _SCRIPT_JS_MTIME:
+        with open(_SCRIPT_JS_PATH, "rb") as f:
+            _SCRIPT_JS_CACHE = f.read().decode("utf-8")
+        _SCRIPT_JS_MTIME = mtime
+    return _SCRIPT_JS_CACHE
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global http_client
+    http_client = httpx.AsyncClient(
+        timeout=20,
+        # limits go on the transport: the client ignores its own limits when a transport is given
+        transport=httpx.AsyncHTTPTransport(
+            retries=0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        ),
+    )
+    try:
+        _get_local_script()  # warm the script.js cache
+    except Exception:
+        pass
+    await _start_playwright()
+    pruner = asyncio.create_task(_prune_loop())
+    try:
+        yield
+    finally:
+        pruner.cancel()
+        for pid in list(_browsers):
+            await _close_browser(pid)
+        await _stop_playwright()
+        await http_client.aclose()
+        http_client = None
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory="templates")
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -29,60 +88,188 @@ WIN_WIDTH, WIN_HEIGHT = 1920, 1080
 WIN_POS_X, WIN_POS_Y = 0, 0
 WIN_SCALE = 1.0
 MAX_CONCURRENT = 3
+MAX_PROFILES = 1024           # số profile tối đa giữ trong running_profiles
+PROFILE_TTL = 6 * 3600        # giây; profile đã dừng/lỗi cũ hơn sẽ bị xoá
+PRUNE_INTERVAL = 60           # giây giữa các lần dọn
+INJECT_TIMEOUT = 15           # giây tối đa cho mỗi lần inject vào một page
 # ====================
 
-semaphore = asyncio.Semaphore(MAX_CONCURRENT)
-running_profiles: Dict[str, Dict] = {}  # profile_id -> info dict
+# admission control: counter guarded by a condition so the cap can change at runtime
+_cond = asyncio.Condition()
+_active = 0
+_cmax = MAX_CONCURRENT
+running_profiles: "OrderedDict[str, Mapping]" = OrderedDict()  # profile_id -> read-only info snapshot, oldest first
+_TERMINAL_STATUSES = ("error", "stopped")
+_status_view: Dict[str, dict] = {}  # profile_id -> JSON-ready /status view, rebuilt on every write
+_inflight: Dict[str, asyncio.Task] = {}  # profile_id -> running start_profile_task (strong ref until done)
+
+# persistent CDP connections, kept out of running_profiles so /status stays JSON-serializable
+_pw = None  # Playwright driver shared by all CDP connections, started in lifespan
+_browsers: Dict[str, object] = {}  # profile_id -> playwright Browser
+_browser_locks: Dict[str, asyncio.Lock] = {}  # profile_id -> lock serializing use of the Browser
+_init_scripts = weakref.WeakKeyDictionary()  # BrowserContext -> scripts already registered
+_script_cache: Dict[str, Tuple[str, str]] = {}  # script_url -> (etag, body)
+
+
+def _forget_profile(profile_id: str):
+    running_profiles.pop(profile_id, None)
+    _status_view.pop(profile_id, None)
+    lock = _browser_locks.get(profile_id)
+    if lock is not None and not lock.locked():
+        del _browser_locks[profile_id]
+
+
+def _evict_profiles():
+    """Drop the oldest finished profiles while running_profiles is over MAX_PROFILES."""
+    excess = len(running_profiles) - MAX_PROFILES
+    if excess <= 0:
+        return
+    victims = [pid for pid, info in running_profiles.items() if info.get("status") in _TERMINAL_STATUSES][:excess]
+    for pid in victims:
+        _forget_profile(pid)
+
+
+def _prune_expired(now: float):
+    """Drop finished profiles whose started_at is older than PROFILE_TTL."""
+    expired = [
+        pid for pid, info in running_profiles.items()
+        if info.get("status") in _TERMINAL_STATUSES and now - info.get("started_at", now) > PROFILE_TTL
+    ]
+    for pid in expired:
+        _forget_profile(pid)
+
+
+async def _prune_loop():
+    while True:
+        await asyncio.sleep(PRUNE_INTERVAL)
+        _prune_expired(time.time())
+
+
+def _set_profile(profile_id: str, info: dict) -> Mapping:
+    """
+    The single write path for running_profiles: store a read-only snapshot
+    and precompute the view served by /status.
+    """
+    snapshot = MappingProxyType(info)
+    running_profiles[profile_id] = snapshot
+    view = {**info, "exists": True}
+    if "started_at" in info:
+        view["started_at_human"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info["started_at"]))
+    _status_view[profile_id] = view
+    return snapshot
+
+
+def _update_profile(profile_id: str, changes: dict) -> Mapping:
+    """
+    Copy-on-write update: replace the profile's snapshot with a new read-only one.
+    Readers can hold on to the old snapshot without copying it.
+    """
+    return _set_profile(profile_id, {**running_profiles.get(profile_id, {}), **changes})
 
 
 # ---- GPM start ----
-def _call_gpm_start(profile_id: str) -> dict:
+def _gpm_headers() -> dict:
+    headers = {}
+    if GPM_API_TOKEN:
+        headers["Authorization"] = f"Bearer {GPM_API_TOKEN}"
+    return headers
+
+
+async def _call_gpm_start(profile_id: str) -> dict:
     """
     Start a profile via GPM local API:
     GET /api/v3/profiles/start/{id}?win_size=WxH&win_pos=X,Y&win_scale=S
     Returns parsed JSON from GPM.
     """
     url = f"{GPM_API_BASE}/api/v3/profiles/start/{profile_id}"
-    headers = {}
-    if GPM_API_TOKEN:
-        headers["Authorization"] = f"Bearer {GPM_API_TOKEN}"
-
     params = {
         "win_size": f"{WIN_WIDTH},{WIN_HEIGHT}",
         "win_pos": f"{WIN_POS_X},{WIN_POS_Y}",
         "win_scale": f"{WIN_SCALE}",
     }
-    resp = requests.get(url, headers=headers, params=params, timeout=20)
+    resp = await http_client.get(url, headers=_gpm_headers(), params=params)
     resp.raise_for_status()
-    return resp.json()
+    return orjson.loads(resp.content)
 
 
-def _get_ws_from_port(host: str, port: int, timeout_s: float = 6.0) -> Optional[str]:
-    base = f"http://{host}:{port}"
-    deadline = time.time() + timeout_s
-    while time.time() < deadline:
+async def _call_gpm_close(profile_id: str) -> dict:
+    """
+    Close a profile via GPM local API:
+    GET /api/v3/profiles/close/{id}
+    """
+    url = f"{GPM_API_BASE}/api/v3/profiles/close/{profile_id}"
+    resp = await http_client.get(url, headers=_gpm_headers())
+    resp.raise_for_status()
+    return orjson.loads(resp.content)
+
+
+_WS_PROBE_DELAYS = (0.0, 0.05, 0.1, 0.25, 0.5, 1.0)  # backoff while the debug port is not listening yet; last step repeats
+
+
+async def _get_ws_from_port(host: str, port: int, timeout_s: float = 6.0) -> Optional[str]:
+    """
+    Read webSocketDebuggerUrl from /json/version (always present on Chromium >= 65).
+    Retries with backoff only while the port cannot be connected to (refused or connect
+    timeout), for up to timeout_s; any answer ends the probe.
+    """
+    url = f"http://{host}:{port}/json/version"
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout_s
+    attempt = 0
+    while True:
+        delay = _WS_PROBE_DELAYS[min(attempt, len(_WS_PROBE_DELAYS) - 1)]
+        if loop.time() + delay >= deadline:
+            return None
+        await asyncio.sleep(delay)
+        attempt += 1
+        try:
+            r = await http_client.get(url, timeout=2)
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            continue
+        except Exception:
+            return None
+        if not r.is_success:
+            return None
         try:
-            r = requests.get(f"{base}/json/version", timeout=2)
-            if r.ok:
-                j = r.json()
-                if "webSocketDebuggerUrl" in j:
-                    return j["webSocketDebuggerUrl"]
-            r2 = requests.get(f"{base}/json", timeout=2)
-            if r2.ok:
-                arr = r2.json()
-                if isinstance(arr, list):
-                    for it in arr:
-                        if "webSocketDebuggerUrl" in it:
-                            return it["webSocketDebuggerUrl"]
+            return orjson.loads(r.content).get("webSocketDebuggerUrl")
         except Exception:
-            time.sleep(0.25)
+            # unexpected body (e.g. not a JSON object): treat as no URL
+            return None
+
+
+async def _fetch_ws_once(host: str, port: int) -> Optional[str]:
+    """Single non-retrying /json/version probe for an already-running browser."""
+    try:
+        r = await http_client.get(f"http://{host}:{port}/json/version", timeout=2)
+        if r.is_success:
+            return orjson.loads(r.content).get("webSocketDebuggerUrl")
+    except Exception:
+        pass
     return None
 
 
-def start_profile_sync(profile_id: str) -> dict:
-    info = {"profile_id": profile_id, "status": "starting", "started_at": time.time()}
+@asynccontextmanager
+async def _admission_slot():
+    """Hold one of the _cmax admission slots for the duration of the block."""
+    global _active
+    async with _cond:
+        await _cond.wait_for(lambda: _active < _cmax)
+        _active += 1
+    try:
+        yield
+    finally:
+        async with _cond:
+            _active -= 1
+            _cond.notify(1)
+
+
+async def start_profile(profile_id: str) -> dict:
+    info = {"profile_id": profile_id, "status": "starting"}
     try:
-        resp = _call_gpm_start(profile_id)
+        # only the GPM start call is gated; debug-port discovery below runs without a slot
+        async with _admission_slot():
+            info["started_at"] = time.time()
+            resp = await _call_gpm_start(profile_id)
         data = resp.get("data") if isinstance(resp, dict) else None
         if not data:
             info["status"] = "error"
@@ -99,7 +286,7 @@ def start_profile_sync(profile_id: str) -> dict:
             except Exception:
                 info["debug_port"] = port
             info["status"] = "started"
-            ws = _get_ws_from_port(host, int(port))
+            ws = await _get_ws_from_port(host, int(port))
             info["websocket"] = ws
         else:
             info["status"] = "started (no debug info)"
@@ -110,112 +297,263 @@ def start_profile_sync(profile_id: str) -> dict:
     return info
 
 
+def _clear_inflight(profile_id: str, task: asyncio.Task):
+    if _inflight.get(profile_id) is task:
+        del _inflight[profile_id]
+
+
 async def start_profile_task(profile_id: str):
-    async with semaphore:
-        running_profiles[profile_id] = {
-            "status": "queued",
-            "profile_id": profile_id,
-            "started_at": time.time(),
-        }
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, partial(start_profile_sync, profile_id))
-        running_profiles[profile_id].update(result)
-        return running_profiles[profile_id]
+    _set_profile(profile_id, {
+        "status": "queued",
+        "profile_id": profile_id,
+        "started_at": time.time(),
+    })
+    running_profiles.move_to_end(profile_id)
+    _evict_profiles()
+    result = await start_profile(profile_id)
+    if result.get("websocket"):
+        # connect once now so the first /inject skips the CDP handshake
+        try:
+            async with _browser_locks.setdefault(profile_id, asyncio.Lock()):
+                await _connect_browser(profile_id, result["websocket"])
+        except Exception:
+            pass
+    return _update_profile(profile_id, result)
 
 
 # ---- Playwright inject helper ----
-def _inject_into_all_pages(ws_or_http: str, script_url: Optional[str], inline_js: Optional[str]) -> dict:
+async def _start_playwright():
+    """Start the shared Playwright driver; leave it unset if playwright is missing or broken."""
+    global _pw
+    try:
+        # import inside function to avoid failing startup if playwright not installed
+        from playwright.async_api import async_playwright
+        _pw = await async_playwright().start()
+    except Exception:
+        _pw = None
+
+
+def _get_playwright():
+    if _pw is None:
+        raise RuntimeError("Playwright not installed or not configured. Install with 'pip install playwright' and run 'playwright install chromium'")
+    return _pw
+
+
+async def _stop_playwright():
+    global _pw
+    if _pw is not None:
+        try:
+            await _pw.stop()
+        except Exception:
+            pass
+        _pw = None
+
+
+async def _connect_browser(profile_id: str, ws_or_http: str):
+    """
+    Return the cached CDP Browser for a profile, connecting if there is none or it dropped.
+    Callers must hold _browser_locks[profile_id].
+    """
+    browser = _browsers.get(profile_id)
+    if browser is not None and browser.is_connected():
+        return browser
+    pw = _get_playwright()
+    browser = await pw.chromium.connect_over_cdp(ws_or_http)
+    _browsers[profile_id] = browser
+    return browser
+
+
+async def _disconnect_browser(profile_id: str):
+    """
+    Disconnect the cached CDP Browser for a profile, if any.
+    Callers must hold _browser_locks[profile_id].
+    """
+    browser = _browsers.pop(profile_id, None)
+    if browser is not None:
+        try:
+            await browser.close()
+        except Exception:
+            pass
+
+
+async def _close_browser(profile_id: str):
+    """Disconnect the cached CDP Browser for a profile, waiting for in-progress injects."""
+    async with _browser_locks.setdefault(profile_id, asyncio.Lock()):
+        await _disconnect_browser(profile_id)
+
+
+async def _fetch_script(url: str) -> Optional[str]:
+    """
+    Download a script once on the server side, revalidating cached copies with If-None-Match.
+    Returns None if it cannot be fetched and nothing is cached.
+    """
+    cached = _script_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    try:
+        r = await http_client.get(url, headers=headers, follow_redirects=True)
+        if r.status_code == 304 and cached:
+            return cached[1]
+        r.raise_for_status()
+    except Exception:
+        return cached[1] if cached else None
+    etag = r.headers.get("ETag")
+    if etag:
+        _script_cache[url] = (etag, r.text)
+    else:
+        _script_cache.pop(url, None)
+    return r.text
+
+
+async def _add_script_url(page, script_url: str) -> bool:
+    """Fallback when the server cannot fetch script_url: let the page load it."""
+    try:
+        await asyncio.wait_for(page.add_script_tag(url=script_url), INJECT_TIMEOUT)
+        return True
+    except Exception:
+        return False
+
+
+async def _inject_context(ctx, pages: list, js: str) -> int:
+    """
+    Register js as an init script on the context (future navigations) once,
+    then run it in the currently open pages. Returns how many pages ran it.
+    """
+    registered = _init_scripts.setdefault(ctx, set())
+    # registration for future navigations runs alongside the open-page injects, so a
+    # failed registration does not stop the script from running in the pages open now
+    results = await asyncio.gather(
+        _register_init_script(ctx, registered, js),
+        *(asyncio.wait_for(_run_in_page(page, js), INJECT_TIMEOUT) for page in pages),
+        return_exceptions=True,
+    )
+    return sum(not isinstance(res, BaseException) for res in results[1:])
+
+
+# Runs the source as a real inline <script>: top-level let/const/class become globals, as with
+# add_script_tag(content=...) and add_init_script, and a trailing Promise is not awaited.
+# Returns false if the page's CSP blocks inline scripts (detected with a probe script)
+# or Trusted Types rejects the source.
+_RUN_AS_SCRIPT_JS = """s => {
+    const root = document.head || document.documentElement;
+    const el = document.createElement("script");
+    try {
+        el.textContent = s;  // throws under Trusted Types enforcement, before anything runs
+    } catch (e) {
+        return false;
+    }
+    root.appendChild(el);
+    el.remove();
+    const probe = document.createElement("script");
+    probe.textContent = "document.currentScript.dataset.ran = '1'";
+    root.appendChild(probe);
+    probe.remove();
+    return probe.dataset.ran === "1";
+}"""
+
+
+async def _run_in_page(page, js: str):
     """
-    Attach via Playwright CDP and inject into all contexts/pages.
+    Run js in an already-open page with <script> semantics, without awaiting its result.
+    If CSP blocks inline scripts, fall back to indirect eval; in that case top-level
+    let/const/class stay local to the eval and are not visible to later scripts.
+    """
+    if not await page.evaluate(_RUN_AS_SCRIPT_JS, js):
+        await page.evaluate("s => { (0, eval)(s); }", js)
+
+
+async def _register_init_script(ctx, registered: set, js: str):
+    """
+    Add js as an init script on ctx unless it is already registered.
+    It is marked registered only once add_init_script completes. After a timeout the
+    browser may or may not have applied it, so a later inject retries and the script
+    could then run twice per navigation.
+    """
+    if js in registered:
+        return
+    await asyncio.wait_for(ctx.add_init_script(script=js), INJECT_TIMEOUT)
+    registered.add(js)
+
+
+async def _inject_into_all_pages_async(browser, script_url: Optional[str], inline_js: Optional[str]) -> dict:
+    """
+    Inject into all contexts/pages of an already-connected CDP Browser.
+    One add_init_script per context plus one evaluate per open page, run concurrently.
     Returns stats dict.
     """
     stats = {"contexts": 0, "pages": 0, "injected_url": 0, "injected_inline": 0}
-    try:
-        # import inside function to avoid failing startup if playwright not installed
-        from playwright.sync_api import sync_playwright
-    except Exception as e:
-        raise RuntimeError("Playwright not installed or not configured. Install with 'pip install playwright' and run 'playwright install chromium'") from e
-
-    with sync_playwright() as pw:
-        browser = pw.chromium.connect_over_cdp(ws_or_http)
-        contexts = browser.contexts or []
-        stats["contexts"] = len(contexts)
-        # if no contexts, still operate with browser -- but loop contexts list (could be empty)
-        if not contexts:
-            # create a temp context so we can inject
-            ctx = browser.new_context()
-            contexts = [ctx]
-
-        for ctx in contexts:
-            pages = ctx.pages
-            if not pages:
-                pages = [ctx.new_page()]
-            for page in pages:
-                stats["pages"] += 1
-                # try external script first
-                if script_url:
-                    try:
-                        page.add_script_tag(url=script_url)
-                        stats["injected_url"] += 1
-                    except Exception:
-                        # ignore and try inline fallback
-                        pass
-                if inline_js:
-                    try:
-                        # prefer add_script_tag(content=...) so it appears as <script>
-                        page.add_script_tag(content=inline_js)
-                        stats["injected_inline"] += 1
-                    except Exception:
-                        try:
-                            page.evaluate(inline_js)
-                            stats["injected_inline"] += 1
-                        except Exception:
-                            # cannot inject into this page
-                            pass
+    contexts = browser.contexts or []
+    stats["contexts"] = len(contexts)
+    # if no contexts, still operate with browser -- but loop contexts list (could be empty)
+    if not contexts:
+        # create a temp context so we can inject
+        ctx = await browser.new_context()
+        contexts = [ctx]
+
+    targets = [(ctx, ctx.pages or [await ctx.new_page()]) for ctx in contexts]
+    stats["pages"] = sum(len(pages) for _, pages in targets)
+
+    # external script first, so inline code can rely on its globals
+    # (except on CSP-restricted pages, see _run_in_page)
+    if script_url:
+        url_js = await _fetch_script(script_url)
+        if url_js is not None:
+            counts = await asyncio.gather(
+                *(_inject_context(ctx, pages, url_js) for ctx, pages in targets),
+                return_exceptions=True,
+            )
+        else:
+            counts = await asyncio.gather(
+                *(_add_script_url(page, script_url) for _, pages in targets for page in pages),
+                return_exceptions=True,
+            )
+        stats["injected_url"] = sum(c for c in counts if not isinstance(c, BaseException))
+    if inline_js:
+        counts = await asyncio.gather(
+            *(_inject_context(ctx, pages, inline_js) for ctx, pages in targets),
+            return_exceptions=True,
+        )
+        stats["injected_inline"] = sum(c for c in counts if not isinstance(c, BaseException))
     return stats
 
 
 # ---- FastAPI endpoints ----
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request, "running": running_profiles, "max_concurrent": MAX_CONCURRENT})
+    return templates.TemplateResponse("index.html", {"request": request, "running": running_profiles, "max_concurrent": _cmax})
+
+
+@app.post("/concurrency")
+async def set_concurrency(max_concurrent: int = Form(...)):
+    global _cmax
+    if max_concurrent < 1:
+        return ORJSONResponse({"ok": False, "message": "max_concurrent phải >= 1."})
+    async with _cond:
+        grew = max_concurrent > _cmax
+        _cmax = max_concurrent
+        if grew:
+            _cond.notify_all()
+    return ORJSONResponse({"ok": True, "max_concurrent": _cmax, "active": _active})
 
 
 @app.post("/start_profile")
 async def start_profile_endpoint(profile_id: str = Form(...)):
-    if profile_id in running_profiles and running_profiles[profile_id].get("status") not in ("error",):
-        return JSONResponse({"ok": False, "message": f"Profile {profile_id} đang chạy/đang hàng đợi.", "state": running_profiles[profile_id]})
-    asyncio.create_task(start_profile_task(profile_id))
-    return JSONResponse({"ok": True, "message": f"Starting profile {profile_id}...", "profile_id": profile_id})
+    # no await between the checks and registering the task, so concurrent requests cannot both start
+    if profile_id in _inflight or profile_id in running_profiles and running_profiles[profile_id].get("status") not in _TERMINAL_STATUSES:
+        return ORJSONResponse({"ok": False, "message": f"Profile {profile_id} đang chạy/đang hàng đợi.", "state": dict(running_profiles.get(profile_id, {}))})
+    task = asyncio.create_task(start_profile_task(profile_id))
+    _inflight[profile_id] = task
+    task.add_done_callback(partial(_clear_inflight, profile_id))
+    return ORJSONResponse({"ok": True, "message": f"Starting profile {profile_id}...", "profile_id": profile_id})
 
 
 @app.get("/status")
 async def status():
-    out = {}
-    for pid, info in running_profiles.items():
-        copy = info.copy()
-        if "started_at" in copy:
-            try:
-                copy["started_at_human"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(copy["started_at"]))
-            except Exception:
-                pass
-        out[pid] = copy
-    return out
+    return ORJSONResponse({pid: _status_view[pid] for pid in running_profiles})
 
 
 @app.get("/status/{profile_id}")
 async def status_one(profile_id: str):
-    info = running_profiles.get(profile_id)
-    if not info:
-        return {"exists": False}
-    copy = info.copy()
-    if "started_at" in copy:
-        try:
-            copy["started_at_human"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(copy["started_at"]))
-        except Exception:
-            pass
-    copy["exists"] = True
-    return copy
+    return ORJSONResponse(_status_view.get(profile_id, {"exists": False}))
 
 
 @app.post("/inject")
@@ -226,11 +564,18 @@ async def inject_endpoint(
 ):
     info = running_profiles.get(profile_id)
     if not info or not info.get("debug_host") or not info.get("debug_port"):
-        return JSONResponse({"ok": False, "message": "Profile chưa start hoặc thiếu debug host/port."})
+        return ORJSONResponse({"ok": False, "message": "Profile chưa start hoặc thiếu debug host/port."})
+    if info.get("status") in _TERMINAL_STATUSES:
+        return ORJSONResponse({"ok": False, "message": f"Profile {profile_id} không chạy (status: {info.get('status')})."})
 
     host = info["debug_host"]
     port = int(info["debug_port"])
-    ws = info.get("websocket") or _get_ws_from_port(host, port)
+    ws = info.get("websocket")
+    if not ws:
+        ws = await _fetch_ws_once(host, port)
+        # only persist if the profile was not pruned or restarted during the await
+        if ws and running_profiles.get(profile_id) is info:
+            _update_profile(profile_id, {"websocket": ws})
     if not ws:
         # Playwright connect_over_cdp accepts http://host:port as well
         ws = f"http://{host}:{port}"
@@ -240,22 +585,39 @@ async def inject_endpoint(
 
     # nếu không có url và không có inline -> đọc file ./script.js
     if not final_inline_js and not final_script_url:
-        local_path = os.path.join(os.path.dirname(__file__), "script.js")
-        if os.path.isfile(local_path):
-            try:
-                with open(local_path, "r", encoding="utf-8") as f:
-                    final_inline_js = f.read()
-            except Exception as e:
-                return JSONResponse({"ok": False, "message": f"Không đọc được file script.js: {e}"})
-        else:
-            return JSONResponse({"ok": False, "message": "Không có script_url, inline_js, và file ./script.js không tồn tại."})
+        try:
+            final_inline_js = _get_local_script()
+        except Exception as e:
+            return ORJSONResponse({"ok": False, "message": f"Không đọc được file script.js: {e}"})
+        if final_inline_js is None:
+            return ORJSONResponse({"ok": False, "message": "Không có script_url, inline_js, và file ./script.js không tồn tại."})
 
-    loop = asyncio.get_event_loop()
     try:
-        stats = await loop.run_in_executor(
-            None,
-            lambda: _inject_into_all_pages(ws, final_script_url, final_inline_js)
-        )
-        return JSONResponse({"ok": True, "stats": stats})
+        async with _browser_locks.setdefault(profile_id, asyncio.Lock()):
+            # a /stop_profile may have finished while we waited for the lock
+            current = running_profiles.get(profile_id)
+            if not current or current.get("status") in _TERMINAL_STATUSES:
+                return ORJSONResponse({"ok": False, "message": f"Profile {profile_id} không chạy."})
+            browser = await _connect_browser(profile_id, ws)
+            stats = await _inject_into_all_pages_async(browser, final_script_url, final_inline_js)
+        return ORJSONResponse({"ok": True, "stats": stats})
     except Exception as e:
-        return JSONResponse({"ok": False, "message": f"Inject failed: {e}"})
+        return ORJSONResponse({"ok": False, "message": f"Inject failed: {e}"})
+
+
+@app.post("/stop_profile")
+async def stop_profile_endpoint(profile_id: str = Form(...)):
+    if profile_id not in running_profiles:
+        return ORJSONResponse({"ok": False, "message": f"Profile {profile_id} không tồn tại."})
+    if profile_id in _inflight:
+        return ORJSONResponse({"ok": False, "message": f"Profile {profile_id} đang khởi động, thử lại sau.", "state": dict(running_profiles[profile_id])})
+    # hold the browser lock across disconnect and GPM close so no inject can reconnect in between
+    async with _browser_locks.setdefault(profile_id, asyncio.Lock()):
+        await _disconnect_browser(profile_id)
+        try:
+            await _call_gpm_close(profile_id)
+        except Exception as e:
+            _update_profile(profile_id, {"status": "error", "error": f"Close failed: {e}"})
+            return ORJSONResponse({"ok": False, "message": f"Close failed: {e}"})
+        _update_profile(profile_id, {"status": "stopped"})
+    return ORJSONResponse({"ok": True, "message": f"Stopped profile {profile_id}.", "profile_id": profile_id})